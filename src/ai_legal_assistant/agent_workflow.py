@@ -1,42 +1,37 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI # type: ignore
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
 from typing import TypedDict, Annotated, List
+import asyncio
+import logging
 import operator
-from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
-from langchain.agents import Tool
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.tools import StructuredTool
 
 from .models import CompanyFiling
-from .tools import sec_edgar_search, sedar_plus_search, cvm_empresas_net_search, general_web_search, read_document_from_url, fallback_search, real_sec_search
+from .tools import sec_edgar_search, sedar_plus_search, cvm_empresas_net_search, general_web_search, read_document_from_url, fallback_search, real_sec_search, all_regulators_search
 from .config import GOOGLE_API_KEY
 
-# 1. Define Tools for the Agent
+logger = logging.getLogger(__name__)
+
+# 1. Define Tools for the Agent (async coroutines so multiple tool calls in
+# one LLM turn can run concurrently instead of serializing on network I/O)
 tools = [
-    Tool(name="search_sec_edgar", func=sec_edgar_search, description="Use this to search for US company filings on the SEC EDGAR database. Input should be a company name and the form type, e.g., 'Microsoft 10-K'."),
-    Tool(name="real_sec_search", func=real_sec_search, description="Use this for real-time SEC EDGAR searches using their public API. Input should be a company name."),
-    Tool(name="search_sedar_plus", func=sedar_plus_search, description="Use this to search for Canadian company filings on the SEDAR+ database. Input should be a company name and the form type."),
-    Tool(name="search_cvm_empresas_net", func=cvm_empresas_net_search, description="Use this to search for Brazilian company filings on the CVM Empresas.NET database. Input should be a company name and the form type, e.g., 'Petrobras Formulário de Referência'."),
-    Tool(name="read_document_from_url", func=read_document_from_url, description="Use this to read the full text content of a document from a specific URL. The input MUST be a valid URL."),
-    Tool(name="general_web_search", func=general_web_search, description="Use this as a fallback for general research or if you cannot find the document in the official databases."),
-    Tool(name="fallback_search", func=fallback_search, description="Use this when other search tools fail or return errors. This provides mock data for demonstration purposes."),
+    StructuredTool.from_function(coroutine=sec_edgar_search, name="search_sec_edgar", description="Use this to search for US company filings on the SEC EDGAR database. Input should be a company name and the form type, e.g., 'Microsoft 10-K'."),
+    StructuredTool.from_function(coroutine=real_sec_search, name="real_sec_search", description="Use this for real-time SEC EDGAR searches using their public API. Input should be a company name."),
+    StructuredTool.from_function(coroutine=sedar_plus_search, name="search_sedar_plus", description="Use this to search for Canadian company filings on the SEDAR+ database. Input should be a company name and the form type."),
+    StructuredTool.from_function(coroutine=cvm_empresas_net_search, name="search_cvm_empresas_net", description="Use this to search for Brazilian company filings on the CVM Empresas.NET database. Input should be a company name and the form type, e.g., 'Petrobras Formulário de Referência'."),
+    StructuredTool.from_function(coroutine=read_document_from_url, name="read_document_from_url", description="Use this to read the full text content of a document from a specific URL. The input MUST be a valid URL."),
+    StructuredTool.from_function(coroutine=all_regulators_search, name="search_all_regulators", description="Use this to search SEC EDGAR, SEDAR+ and CVM Empresas.NET at once when the jurisdiction is unclear. Input should be a company name and the form type."),
+    StructuredTool.from_function(coroutine=general_web_search, name="general_web_search", description="Use this as a fallback for general research or if you cannot find the document in the official databases."),
+    StructuredTool.from_function(func=fallback_search, name="fallback_search", description="Use this when other search tools fail or return errors. This provides mock data for demonstration purposes."),
 ]
 
-# 2. Define Agent State
-class AgentState(TypedDict):
-    messages: Annotated[List[BaseMessage], operator.add]
+# Static system prompt, kept as a module constant and always sent as the first
+# (unchanging) block of the chat template. Provider-side prompt caching keys on
+# a stable prefix, so no dynamic content may be interpolated into this string;
+# per-request messages go last via the "{messages}" placeholder.
+SYSTEM_PROMPT = """You are a highly specialized legal assistant. Your purpose is to find official company filings and extract specific information.
 
-# 3. Define Agent Logic (Nodes)
-class FilingAgent:
-    def __init__(self, llm, tools, checkpointer):
-        self.llm = llm
-        self.tools = tools
-        self.checkpointer = checkpointer
-        self.agent = self._create_agent()
-        self.graph = self._create_graph()
-
-    def _create_agent(self):
-        system_prompt = """You are a highly specialized legal assistant. Your purpose is to find official company filings and extract specific information.
+        Preliminary search results from the official databases (SEC EDGAR, SEDAR+, CVM Empresas.NET) may already be included in the conversation. When they are present, do NOT repeat those searches — go straight to picking the best document URL and reading it.
 
         **Follow these steps:**
         1.  **Analyze the user's request** to identify the company, the document type, and the jurisdiction (USA, Canada, or Brazil).
@@ -76,56 +71,189 @@ class FilingAgent:
         }}
         ```
         """
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("placeholder", "{messages}"),
-        ])
-        
-        return prompt | self.llm.bind_tools(tools)
+
+# Prompt template construction and tool binding are pure setup; build the
+# template once at module scope and memoize the bound pipeline per LLM so
+# instantiating another FilingAgent (tests, warm reloads) costs a dict probe.
+_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    ("placeholder", "{messages}"),
+])
+
+_BOUND_AGENTS = {}
+
+def _bound_agent(llm):
+    pipeline = _BOUND_AGENTS.get(id(llm))
+    if pipeline is None:
+        pipeline = _PROMPT | llm.bind_tools(tools)
+        _BOUND_AGENTS[id(llm)] = pipeline
+    return pipeline
+
+# 2. Define Agent State
+class AgentState(TypedDict):
+    messages: Annotated[List[BaseMessage], operator.add]
+    # (source, result) pairs appended concurrently by the jurisdictional
+    # search nodes during the fan-out phase
+    search_results: Annotated[List[tuple], operator.add]
+
+# 3. Define Agent Logic (Nodes)
+class FilingAgent:
+    def __init__(self, llm, tools, checkpointer):
+        self.llm = llm
+        self.tools = tools
+        self.checkpointer = checkpointer
+        self.agent = self._create_agent()
+        # Separate binding for the final answer: Gemini's native structured
+        # output fills the CompanyFiling schema directly
+        self.structured_llm = llm.with_structured_output(CompanyFiling)
+        self.graph = self._create_graph()
+
+    def _create_agent(self):
+        return _bound_agent(self.llm)
 
     def _create_graph(self):
+        # Imported here (not at module top) so merely importing this module —
+        # e.g. for a /health probe — doesn't pay langgraph's import cost
+        from langgraph.graph import StateGraph, END
+
         graph = StateGraph(AgentState)
+        graph.add_node("dispatch", self.dispatch)
+        graph.add_node("search_sec", self.search_sec)
+        graph.add_node("search_sedar", self.search_sedar)
+        graph.add_node("search_cvm", self.search_cvm)
+        graph.add_node("synthesize", self.synthesize)
         graph.add_node("agent", self.call_agent)
-        graph.add_node("tools", self.call_tools)
-        graph.set_entry_point("agent")
+        graph.add_node("tools", self.acall_tools)
+        graph.add_node("format_output", self.format_output)
+        graph.set_entry_point("dispatch")
+        # Fan the three jurisdictional searches out as one concurrent step
+        # instead of letting the LLM probe sources across sequential turns
+        graph.add_conditional_edges(
+            "dispatch",
+            self.fan_out,
+            ["search_sec", "search_sedar", "search_cvm"]
+        )
+        graph.add_edge("search_sec", "synthesize")
+        graph.add_edge("search_sedar", "synthesize")
+        graph.add_edge("search_cvm", "synthesize")
+        graph.add_edge("synthesize", "agent")
         graph.add_conditional_edges(
             "agent",
             self.should_continue,
-            {"tools": "tools", END: END}
+            {"tools": "tools", "format": "format_output"}
         )
         graph.add_edge("tools", "agent")
+        graph.add_edge("format_output", END)
         return graph.compile(checkpointer=self.checkpointer)
 
+    def dispatch(self, state: AgentState):
+        # Pass-through entry point; the real work happens in fan_out
+        return {}
+
+    def fan_out(self, state: AgentState):
+        from langgraph.types import Send
+
+        # Send API: dispatch all three jurisdictional searches in parallel
+        return [
+            Send("search_sec", state),
+            Send("search_sedar", state),
+            Send("search_cvm", state),
+        ]
+
+    async def search_sec(self, state: AgentState):
+        query = state['messages'][0].content
+        result = await sec_edgar_search(query)
+        return {"search_results": [("SEC EDGAR", result)]}
+
+    async def search_sedar(self, state: AgentState):
+        query = state['messages'][0].content
+        result = await sedar_plus_search(query)
+        return {"search_results": [("SEDAR+", result)]}
+
+    async def search_cvm(self, state: AgentState):
+        query = state['messages'][0].content
+        result = await cvm_empresas_net_search(query)
+        return {"search_results": [("CVM Empresas.NET", result)]}
+
+    def synthesize(self, state: AgentState):
+        # Reduce the fan-out results: keep usable ones, flag total failure so
+        # the agent knows to fall back instead of re-searching
+        usable = [
+            (source, result) for source, result in state.get('search_results', [])
+            if result and not str(result).startswith("Error")
+        ]
+        if usable:
+            summary = "\n\n".join(f"[{source}]\n{result}" for source, result in usable)
+            content = (
+                "Preliminary search results from the official databases:\n\n"
+                f"{summary}\n\n"
+                "Pick the most promising document URL, read it, and produce the final structured answer."
+            )
+        else:
+            content = (
+                "All jurisdictional searches failed or returned errors. "
+                "Use fallback_search or general_web_search before answering."
+            )
+        return {"messages": [HumanMessage(content=content)]}
+
     def should_continue(self, state: AgentState):
         if isinstance(state['messages'][-1], ToolMessage):
             return "agent" # If the last message was a tool result, go back to the agent to decide next step
         if not state['messages'][-1].tool_calls:
-            return END # If the LLM didn't call a tool, the conversation is over
+            return "format" # If the LLM didn't call a tool, emit the structured answer
         return "tools" # Otherwise, call the tools
 
-    def call_agent(self, state: AgentState):
-        print("--- CALLING AGENT ---")
-        response = self.agent.invoke(state)
+    async def format_output(self, state: AgentState):
+        logger.debug("FORMATTING STRUCTURED OUTPUT")
+        # Constrained decoding can't produce malformed JSON or drifting field
+        # names, so downstream parsing never needs a repair pass. The model
+        # call itself can still fail (or yield nothing); degrade to a message
+        # the endpoint's parse-failure branch turns into success=False rather
+        # than letting the exception escape graph.ainvoke as an HTTP 500.
+        try:
+            filing = await self.structured_llm.ainvoke(state['messages'])
+            if filing is None:
+                raise ValueError("structured output call returned no filing")
+        except Exception as e:
+            logger.error("Structured formatting failed: %s", e)
+            return {"messages": [AIMessage(content=f"Structured output failed: {e}")]}
+        return {"messages": [AIMessage(content=filing.model_dump_json())]}
+
+    async def call_agent(self, state: AgentState):
+        logger.debug("CALLING AGENT")
+        response = await self.agent.ainvoke(state)
         return {"messages": [response]}
 
-    def call_tools(self, state: AgentState):
-        print("--- CALLING TOOLS ---")
+    async def acall_tools(self, state: AgentState):
+        logger.debug("CALLING TOOLS")
         tool_calls = state['messages'][-1].tool_calls
-        tool_outputs = []
-        for call in tool_calls:
-            tool_name = call['name']
-            tool_input = call['args']
-            # Find the corresponding tool function
-            tool_func = next((t for t in self.tools if t.name == tool_name), None)
-            if tool_func:
-                output = tool_func.invoke(tool_input)
-                tool_outputs.append(ToolMessage(content=str(output), tool_call_id=call['id']))
-        return {"messages": tool_outputs}
-
-# 4. Factory function to create and return the graph
+        tools_by_name = {t.name: t for t in self.tools}
+
+        async def run_tool(call):
+            tool = tools_by_name.get(call['name'])
+            if tool is None:
+                return None
+            output = await tool.ainvoke(call['args'])
+            return ToolMessage(content=str(output), tool_call_id=call['id'])
+
+        # Run all tool calls from this turn concurrently; wall time is
+        # max(latency) instead of sum(latency)
+        results = await asyncio.gather(*(run_tool(call) for call in tool_calls))
+        return {"messages": [m for m in results if m is not None]}
+
+# 4. Factory functions
+def create_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI # type: ignore
+
+    # gemini-2.5-pro accepts system messages natively; converting them to
+    # human messages would copy the whole prompt into checkpointed history
+    # and defeat provider-side prefix caching
+    return ChatGoogleGenerativeAI(model="gemini-2.5-pro", google_api_key=GOOGLE_API_KEY)
+
 def create_filing_agent_graph():
-    llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro", google_api_key=GOOGLE_API_KEY, convert_system_message_to_human=True)
+    from langgraph.checkpoint.memory import MemorySaver
+
+    llm = create_llm()
     memory = MemorySaver()
     agent = FilingAgent(llm, tools, memory)
     return agent.graph 
\ No newline at end of file
@@ -1,15 +1,21 @@
+import logging
 import os
+
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load .env file if it exists, otherwise continue without it
 try:
     load_dotenv()
-    print("✓ .env file loaded successfully")
+    logger.debug(".env file loaded successfully")
 except Exception as e:
-    print(f"⚠️  Could not load .env file: {e}")
+    logger.warning("Could not load .env file: %s", e)
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 
-print(f"GOOGLE_API_KEY: {'✓ Set' if GOOGLE_API_KEY else '❌ Not set'}")
-print(f"SERPER_API_KEY: {'✓ Set' if SERPER_API_KEY else '❌ Not set'}") 
\ No newline at end of file
+# Key-presence status is startup diagnostics, not per-request output; logging
+# it at DEBUG keeps stdout clean and costs nothing when the level is higher.
+logger.debug("GOOGLE_API_KEY: %s", "set" if GOOGLE_API_KEY else "not set")
+logger.debug("SERPER_API_KEY: %s", "set" if SERPER_API_KEY else "not set")
@@ -1,21 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import uuid
+from fastapi.responses import ORJSONResponse
+import itertools
+import os
 from langchain_core.messages import HumanMessage
-from .agent_workflow import create_filing_agent_graph
-from .models import CompanyFiling, FilingRequest, FilingResponse
+from .models import CompanyFiling, CompanyFilingList, FilingRequest, FilingResponse, FilingBatchRequest, FilingBatchResponse
 from langchain_core.output_parsers import PydanticOutputParser
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; LOG_LEVEL=DEBUG turns on the hot-path diagnostics that
+# the tool and agent modules emit via logger.debug (whose lazy %-formatting
+# makes them free when the level is higher)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
     title="AI Legal Filing Assistant",
     description="An AI agent that searches and extracts structured data from official company filings across multiple jurisdictions (SEC EDGAR, SEDAR+, CVM Empresas.NET)",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -27,8 +31,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global parser for structured output
-parser = PydanticOutputParser(pydantic_object=CompanyFiling)
+# Thread ids only need to be unique within this process's MemorySaver, so an
+# atomic counter plus pid beats uuid4's per-request CSPRNG read and makes log
+# correlation easier
+_THREAD_IDS = itertools.count()
+
+# Global parser for batch structured output
+batch_parser = PydanticOutputParser(pydantic_object=CompanyFilingList)
+
+@app.on_event("startup")
+async def build_filing_graph():
+    """Compile the agent graph once; requests only vary the thread_id."""
+    # Deferred import: pulling in the agent stack (langgraph, Gemini client,
+    # tools) is a few hundred ms we keep off module import time
+    from .agent_workflow import create_filing_agent_graph, create_llm
+
+    app.state.filing_graph = create_filing_agent_graph()
+    app.state.batch_llm = create_llm()
 
 @app.get("/")
 async def root():
@@ -62,25 +81,27 @@ async def search_filing(request: FilingRequest):
     try:
         logger.info(f"Processing search request: {request.query}")
         
-        # Create a new graph instance for this request
-        filing_agent_graph = create_filing_agent_graph()
-        
+        # Reuse the graph compiled at startup; the MemorySaver checkpointer
+        # isolates conversation state per thread_id
+        filing_agent_graph = app.state.filing_graph
+
         # Use a unique thread_id for each conversation
-        thread_id = str(uuid.uuid4())
+        thread_id = f"req-{next(_THREAD_IDS)}-{os.getpid()}"
         config = {"configurable": {"thread_id": thread_id}}
         
         # Process the query through the agent
-        final_state = filing_agent_graph.invoke(
-            {"messages": [HumanMessage(content=request.query)]},
+        final_state = await filing_agent_graph.ainvoke(
+            {"messages": [HumanMessage(content=request.query)], "search_results": []},
             config=config
         )
         
         # Extract the final response from the agent
         final_response_message = final_state['messages'][-1]
         
-        # Parse the structured output
+        # Validate the structured output directly in pydantic_core, skipping
+        # the stdlib json.loads + dict construction detour
         try:
-            parsed_output = parser.parse(final_response_message.content)
+            parsed_output = CompanyFiling.model_validate_json(final_response_message.content)
             logger.info("Successfully parsed structured output")
             
             return FilingResponse(
@@ -89,46 +110,15 @@ async def search_filing(request: FilingRequest):
             )
             
         except Exception as parse_error:
+            # The format_output node uses constrained decoding, so this only
+            # triggers if the model call itself failed
             logger.error(f"Failed to parse structured output: {parse_error}")
             logger.info(f"Raw agent response: {final_response_message.content}")
-            
-            # Try to extract useful information from the raw response
-            try:
-                import json
-                raw_json = json.loads(final_response_message.content)
-                
-                # Create a structured response from the raw JSON
-                structured_data = {
-                    "contract_name": raw_json.get("filing_type", raw_json.get("contract_name", "Unknown")),
-                    "company_name": raw_json.get("company_name", "Unknown"),
-                    "description": raw_json.get("summary", raw_json.get("description", "No description available")),
-                    "filing_date": raw_json.get("filing_date", "Unknown"),
-                    "source_of_information": "SEC EDGAR" if "sec.gov" in raw_json.get("document_url", "") else "Unknown",
-                    "country": "United States" if "sec.gov" in raw_json.get("document_url", "") else "Unknown",
-                    "language": "English",
-                    "applicable_law": "Securities Exchange Act of 1934",
-                    "relevant_clause": "N/A",
-                    "document_url": raw_json.get("document_url", "")
-                }
-                
-                # Create CompanyFiling object manually
-                from .models import CompanyFiling
-                manual_parsed = CompanyFiling(**structured_data)
-                
-                logger.info("Successfully created structured output from raw response")
-                return FilingResponse(
-                    success=True,
-                    data=manual_parsed
-                )
-                
-            except Exception as manual_parse_error:
-                logger.error(f"Failed to manually parse raw response: {manual_parse_error}")
-                
-                # Return the raw response if parsing fails
-                return FilingResponse(
-                    success=False,
-                    error=f"Failed to parse structured output: {str(parse_error)}. Raw response: {final_response_message.content}"
-                )
+
+            return FilingResponse(
+                success=False,
+                error=f"Failed to parse structured output: {str(parse_error)}. Raw response: {final_response_message.content}"
+            )
 
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
@@ -137,6 +127,43 @@ async def search_filing(request: FilingRequest):
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.post("/search_batch", response_model=FilingBatchResponse)
+async def search_filing_batch(request: FilingBatchRequest):
+    """
+    Search for several filings with a single LLM call.
+
+    Batch prompting packs all queries into one prompt, amortizing the system
+    instructions across the batch instead of running N independent agent
+    traces. Best suited to structurally similar queries (e.g., all
+    "find the latest 10-K").
+    """
+    try:
+        logger.info(f"Processing batch search request with {len(request.queries)} queries")
+
+        numbered_queries = "\n".join(f"{i}. {q}" for i, q in enumerate(request.queries, start=1))
+        prompt = (
+            f"You are a legal filing assistant. Given the {len(request.queries)} queries below, "
+            "return a JSON array containing exactly one CompanyFiling object per query, "
+            "in the same order as the queries.\n"
+            f"{batch_parser.get_format_instructions()}\n\n"
+            f"Queries:\n{numbered_queries}"
+        )
+
+        response = await app.state.batch_llm.ainvoke([HumanMessage(content=prompt)])
+        parsed_output = batch_parser.parse(response.content)
+
+        return FilingBatchResponse(
+            success=True,
+            data=parsed_output.root
+        )
+
+    except Exception as e:
+        logger.error(f"Error processing batch request: {str(e)}")
+        return FilingBatchResponse(
+            success=False,
+            error=f"Failed to process batch request: {str(e)}"
+        )
+
 @app.get("/examples")
 async def get_examples():
     """Get example queries for testing the API."""
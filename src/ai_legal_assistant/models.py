@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, RootModel
+from typing import List, Optional
 
 class CompanyFiling(BaseModel):
     """
@@ -28,4 +28,24 @@ class FilingResponse(BaseModel):
     """
     success: bool
     data: Optional[CompanyFiling] = None
+    error: Optional[str] = None
+
+class CompanyFilingList(RootModel):
+    """
+    A list of company filings, used as the structured output of batch queries.
+    """
+    root: List[CompanyFiling]
+
+class FilingBatchRequest(BaseModel):
+    """
+    Request model for batched filing queries.
+    """
+    queries: List[str] = Field(description="Natural language queries, one per filing to search for")
+
+class FilingBatchResponse(BaseModel):
+    """
+    Response model for batched filing results.
+    """
+    success: bool
+    data: Optional[List[CompanyFiling]] = None
     error: Optional[str] = None 
\ No newline at end of file
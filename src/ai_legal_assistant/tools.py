@@ -1,147 +1,482 @@
-try:
-    from langchain_community.utilities.serpapi import GoogleSerperAPIWrapper
-except ImportError:
-    from langchain_community.utilities import GoogleSerperAPIWrapper
 from .config import SERPER_API_KEY
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import atexit
+import collections
+import functools
+import inspect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import httpx
 
-# Initialize the general web search tool
-if SERPER_API_KEY and SERPER_API_KEY != "YOUR_SERPER_API_KEY":
-    search_wrapper = GoogleSerperAPIWrapper(serper_api_key=SERPER_API_KEY)
-else:
-    search_wrapper = None
+logger = logging.getLogger(__name__)
 
-def general_web_search(query: str):
+# Shared async HTTP client: the agent's concurrent tool calls all draw from
+# one connection pool, so repeated fetches to the same host (e.g. sec.gov)
+# reuse sockets instead of paying a TCP+TLS handshake per call.
+# Pool sizing is tunable via SEC_FETCH_MODE: "normal" (default),
+# "caution" or "crawl" for increasingly conservative footprints. The pool
+# spans every host the tools touch (Serper, the regulators, arbitrary filing
+# hosts), so "normal" allows a wide burst ceiling while keeping only a
+# moderate number of idle sockets warm; per-host pressure on sec.gov is
+# bounded separately by the token bucket below.
+_FETCH_MODE = os.getenv("SEC_FETCH_MODE", "normal").lower()
+_FETCH_MODES = {"normal": (100, 20), "caution": (8, 4), "crawl": (2, 2)}
+_MAX_CONNECTIONS, _KEEPALIVE = _FETCH_MODES.get(_FETCH_MODE, (100, 20))
+
+# Advertising compressed encodings matters: HTML compresses 6-10x, and some
+# servers send plain text to clients that don't ask. brotli (from
+# requirements) lets httpx negotiate br on top of gzip/deflate; decoding
+# happens in C before the byte budget is applied.
+_DEFAULT_HEADERS = {
+    'User-Agent': 'ai-legal-assistant contact@example.com',
+    'Accept': 'text/html,application/xhtml+xml',
+    'Accept-Encoding': 'gzip, deflate, br',
+}
+
+_AHTTP = httpx.AsyncClient(
+    timeout=12,
+    limits=httpx.Limits(max_connections=_MAX_CONNECTIONS, max_keepalive_connections=_KEEPALIVE),
+    headers=_DEFAULT_HEADERS,
+    http2=True,
+    follow_redirects=True,
+    transport=httpx.AsyncHTTPTransport(retries=3),
+)
+atexit.register(lambda: asyncio.run(_AHTTP.aclose()))
+
+# SEC asks automated clients to stay below 10 requests/second; tripping the
+# limit yields 403s that today cost the agent a whole extra LLM round-trip to
+# recover from via fallback_search. A token bucket in front of every sec.gov
+# call is far cheaper than that. Rates follow the same SEC_FETCH_MODE knob as
+# the connection pool.
+_SEC_RATES = {"normal": 9, "caution": 4, "crawl": 1}
+
+class _TokenBucket:
+    """Minimal async token bucket allowing `rate` acquisitions per second."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(float(self.rate), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+_SEC_LIMITER = _TokenBucket(_SEC_RATES.get(_FETCH_MODE, 9))
+
+# Per-host politeness bound for document fetches: at most five concurrent
+# streams to any single origin, however wide the shared pool is. The token
+# bucket above caps sec.gov request *rate*; this caps simultaneous transfers
+# for every host the agent wanders onto.
+_HOST_SEMAPHORES = collections.defaultdict(lambda: asyncio.Semaphore(5))
+
+async def _sec_get(url, **kwargs):
+    """GET against sec.gov under the rate limit, retrying transient rejections."""
+    for attempt in range(3):
+        await _SEC_LIMITER.acquire()
+        response = await _AHTTP.get(url, **kwargs)
+        if response.status_code not in (403, 429):
+            break
+        await asyncio.sleep(0.5 * 2 ** attempt)
+    return response
+
+# How much HTML to download before giving up on finding more text. HTML runs
+# roughly 8x the size of its visible text, so 64 KB of markup comfortably
+# yields the 8000 characters we return; DOC_READ_BYTE_BUDGET overrides it for
+# unusually markup-heavy sources.
+_READ_BYTE_BUDGET = int(os.getenv("DOC_READ_BYTE_BUDGET", 64 * 1024))
+
+# Documents whose declared size exceeds this are rejected outright; anything
+# that big is not a page worth sampling 8000 characters from.
+_MAX_DOC_BYTES = 5_000_000
+
+# Bounded TTL cache for idempotent network lookups: agents frequently revisit
+# the same URL or repeat a search within one session, and a cache hit skips
+# the whole HTTP round-trip (and HTML parse, for documents).
+_CACHE_MAXSIZE = 512
+_CACHE_TTL = 600  # seconds
+# Search results go stale faster than the filings they point at
+_SEARCH_TTL = 900
+_DOC_TTL = 3600
+
+# Optional persistence: TOOL_CACHE_PATH points the cache at a SQLite file so
+# Serper responses and fetched documents survive restarts — a redeploy starts
+# from yesterday's warm entries instead of an empty cache. Timestamps are wall
+# clock (not monotonic) because they must compare across processes.
+_CACHE_PATH = os.getenv("TOOL_CACHE_PATH")
+_CACHE_DB = None
+# The connection is shared across to_thread workers; sqlite3 serializes
+# statements but not multi-statement sequences, hence the lock.
+_CACHE_DB_LOCK = threading.Lock()
+_DISK_PUTS = 0
+
+def _cache_db():
+    # Caller must hold _CACHE_DB_LOCK
+    global _CACHE_DB
+    if _CACHE_DB is None:
+        _CACHE_DB = sqlite3.connect(_CACHE_PATH, check_same_thread=False)
+        _CACHE_DB.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, ts REAL, value TEXT)"
+        )
+        # Shed rows no reader could still accept; _DOC_TTL is the longest
+        # TTL any caller uses
+        _CACHE_DB.execute("DELETE FROM cache WHERE ts < ?", (time.time() - _DOC_TTL,))
+        _CACHE_DB.commit()
+        atexit.register(_CACHE_DB.close)
+    return _CACHE_DB
+
+def _disk_get(disk_key, now, ttl):
+    """Blocking disk lookup; run via to_thread so it never stalls the loop."""
+    with _CACHE_DB_LOCK:
+        row = _cache_db().execute(
+            "SELECT ts, value FROM cache WHERE key = ?", (disk_key,)
+        ).fetchone()
+    if row is not None and now - row[0] < ttl:
+        return row
+    return None
+
+def _disk_put(disk_key, now, value):
+    """Blocking disk store; run via to_thread. Prunes expired rows periodically."""
+    global _DISK_PUTS
+    with _CACHE_DB_LOCK:
+        db = _cache_db()
+        db.execute(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (disk_key, now, value)
+        )
+        _DISK_PUTS += 1
+        if _DISK_PUTS % 256 == 0:
+            db.execute("DELETE FROM cache WHERE ts < ?", (now - _DOC_TTL,))
+        db.commit()
+
+def _ttl_cached(normalize=False, ttl=_CACHE_TTL):
+    """Memoize an async function with a bounded, time-limited cache.
+
+    With normalize=True, string arguments are lowercased and stripped before
+    keying, so trivially different search queries share an entry. When
+    TOOL_CACHE_PATH is set, entries are mirrored to SQLite and misses fall
+    through to the disk copy before hitting the network.
+    """
+    def decorator(func):
+        cache = {}
+        lock = asyncio.Lock()
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            # Bind through the signature so positional and keyword spellings
+            # of the same call share a key — StructuredTool invokes these
+            # coroutines with keyword arguments parsed from the tool call
+            key = tuple(sig.bind(*args, **kwargs).arguments.values())
+            if normalize:
+                key = tuple(a.strip().casefold() if isinstance(a, str) else a for a in key)
+            now = time.time()
+            async with lock:
+                hit = cache.get(key)
+                if hit is not None and now - hit[0] < ttl:
+                    return hit[1]
+            disk_key = "\x1f".join((func.__name__,) + tuple(map(str, key)))
+            if _CACHE_PATH:
+                row = await asyncio.to_thread(_disk_get, disk_key, now, ttl)
+                if row is not None:
+                    async with lock:
+                        cache[key] = (row[0], row[1])
+                    return row[1]
+            result = await func(*args, **kwargs)
+            # Failures must stay retryable: a transient error cached for the
+            # full TTL would pin the agent on its fallback path
+            if isinstance(result, str) and result.startswith("Error"):
+                return result
+            async with lock:
+                if len(cache) >= _CACHE_MAXSIZE:
+                    cache.pop(next(iter(cache)))  # evict oldest entry
+                cache[key] = (now, result)
+            if _CACHE_PATH and isinstance(result, str):
+                await asyncio.to_thread(_disk_put, disk_key, now, result)
+            return result
+        return wrapper
+    return decorator
+
+# Known company -> SEC CIK mappings, hoisted to module scope so resolution is
+# a dict probe per query token instead of a per-call dict build plus regex scan.
+_CIK_MAP = {
+    "microsoft": "0000789019",
+    "apple": "0000320193",
+    "amazon": "0001018724",
+    "google": "0001652044",
+    "alphabet": "0001652044",
+    "tesla": "0001318605",
+    "netflix": "0001065280",
+    "meta": "0001326801",
+    "facebook": "0001326801",
+}
+_SEC_BROWSE_URL = "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type=10-K&dateb=&owner=exclude&count=10"
+
+def _resolve_cik(query: str):
+    """Return the CIK of the first known company mentioned in the query, or None."""
+    for token in query.split():
+        cik = _CIK_MAP.get(token.casefold())
+        if cik:
+            return cik
+    return None
+
+# Serper is called directly over the shared async client: the langchain
+# wrapper added per-call validation overhead and a private requests session
+# that couldn't join our connection pool (or its HTTP/2 multiplexing, which
+# suits Serper's single-host endpoint well).
+_SERPER_URL = "https://google.serper.dev/search"
+
+def _serper_configured():
+    return bool(SERPER_API_KEY) and SERPER_API_KEY != "YOUR_SERPER_API_KEY"
+
+def _format_serper(data):
+    """Flattens a Serper JSON response into snippet text for the agent."""
+    answer_box = data.get("answerBox") or {}
+    for key in ("answer", "snippet"):
+        if answer_box.get(key):
+            return answer_box[key]
+    snippets = []
+    for item in data.get("organic", [])[:10]:
+        parts = [item.get("title", ""), item.get("snippet", ""), item.get("link", "")]
+        snippets.append(" ".join(part for part in parts if part))
+    return "\n".join(snippets) if snippets else "No good search results found."
+
+async def _serper(query: str):
+    response = await _AHTTP.post(
+        _SERPER_URL,
+        json={"q": query},
+        headers={"X-API-KEY": SERPER_API_KEY},
+    )
+    response.raise_for_status()
+    return _format_serper(response.json())
+
+async def general_web_search(query: str):
     """A general web search tool for finding secondary sources or as a fallback."""
-    print(f"--- EXECUTING GENERAL SEARCH for: {query} ---")
-    if search_wrapper is None:
+    logger.debug("EXECUTING GENERAL SEARCH for: %s", query)
+    # Config short-circuit stays outside the cached helper so a missing key
+    # never occupies cache entries
+    if not _serper_configured():
         return "Error: SERPER_API_KEY not configured. Please set SERPER_API_KEY in your .env file."
+    return await _cached_serper_search(query)
+
+@_ttl_cached(normalize=True, ttl=_SEARCH_TTL)
+async def _cached_serper_search(query: str):
     try:
-        return search_wrapper.run(query)
+        return await _serper(query)
     except Exception as e:
         return f"Error: Search failed - {str(e)}. Please check your SERPER_API_KEY configuration."
 
-def official_site_search(query: str, site: str):
+async def official_site_search(query: str, site: str):
     """Performs a targeted search on an official site using Google."""
-    print(f"--- EXECUTING SITE-SPECIFIC SEARCH for: {query} on {site} ---")
-    if search_wrapper is None:
+    logger.debug("EXECUTING SITE-SPECIFIC SEARCH for: %s on %s", query, site)
+    if not _serper_configured():
         return f"Error: SERPER_API_KEY not configured. Cannot search {site}."
+    return await _cached_site_search(query, site)
+
+@_ttl_cached(normalize=True, ttl=_SEARCH_TTL)
+async def _cached_site_search(query: str, site: str):
     try:
-        return search_wrapper.run(f"site:{site} {query}")
+        return await _serper(f"site:{site} {query}")
     except Exception as e:
         return f"Error: Search failed for {site} - {str(e)}. Please check your SERPER_API_KEY configuration."
 
-def sec_edgar_search(query: str):
+_REGULATOR_SITES = ("sec.gov", "sedarplus.ca", "cvm.gov.br")
+
+async def multi_site_search(query: str, sites):
+    """
+    Searches several official sites with one Serper call by OR-ing their
+    site: filters, instead of paying one API round-trip (and one unit of
+    paid quota) per site.
+    """
+    logger.debug("EXECUTING MULTI-SITE SEARCH for: %s on %s", query, sites)
+    if not _serper_configured():
+        return f"Error: SERPER_API_KEY not configured. Cannot search {', '.join(sites)}."
+    joined = " OR ".join(f"site:{site}" for site in sites)
+    return await _cached_serper_search(f"({joined}) {query}")
+
+async def all_regulators_search(query: str):
+    """Searches SEC EDGAR, SEDAR+ and CVM Empresas.NET in a single call."""
+    return await multi_site_search(query, _REGULATOR_SITES)
+
+async def sec_edgar_search(query: str):
     """Searches the SEC EDGAR database for US company filings."""
-    print(f"--- EXECUTING REAL SEC EDGAR SEARCH for: {query} ---")
+    logger.debug("EXECUTING REAL SEC EDGAR SEARCH for: %s", query)
     
     # Try real search first
     try:
-        if search_wrapper is not None:
-            result = official_site_search(query, "sec.gov")
+        if _serper_configured():
+            result = await official_site_search(query, "sec.gov")
             if "Error:" not in result:
                 return result
     except Exception as e:
-        print(f"Real search failed: {e}")
+        logger.warning("Real search failed: %s", e)
     
     # Fallback to direct SEC EDGAR search
     try:
-        # Extract company name from query
-        import re
-        company_match = re.search(r'(\w+)', query, re.IGNORECASE)
-        if company_match:
-            company = company_match.group(1).lower()
-            
-            # Direct SEC EDGAR URLs for common companies
-            sec_urls = {
-                "microsoft": "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=0000789019&type=10-K&dateb=&owner=exclude&count=10",
-                "apple": "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=0000320193&type=10-K&dateb=&owner=exclude&count=10",
-                "amazon": "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=0001018724&type=10-K&dateb=&owner=exclude&count=10",
-                "google": "https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK=0001652044&type=10-K&dateb=&owner=exclude&count=10"
-            }
-            
-            if company in sec_urls:
-                return f"Found SEC EDGAR filings for {company.title()}. Direct search URL: {sec_urls[company]}"
+        for token in query.split():
+            cik = _CIK_MAP.get(token.casefold())
+            if cik:
+                return f"Found SEC EDGAR filings for {token.title()}. Direct search URL: {_SEC_BROWSE_URL.format(cik=cik)}"
         
         return f"Real SEC EDGAR search attempted for: {query}. Please visit https://www.sec.gov/edgar/searchedgar/companysearch for manual search."
         
     except Exception as e:
-        return f"Direct SEC search failed: {e}"
+        # "Error" prefix keeps this out of the TTL cache and flags it as
+        # unusable to the synthesize step
+        return f"Error: Direct SEC search failed: {e}"
 
-def sedar_plus_search(query: str):
+async def sedar_plus_search(query: str):
     """Searches the SEDAR+ database for Canadian company filings."""
-    return official_site_search(query, "sedarplus.ca")
+    return await official_site_search(query, "sedarplus.ca")
 
-def cvm_empresas_net_search(query: str):
+async def cvm_empresas_net_search(query: str):
     """Searches the CVM Empresas.NET database for Brazilian company filings."""
-    return official_site_search(query, "cvm.gov.br")
+    return await official_site_search(query, "cvm.gov.br")
 
-def read_document_from_url(url: str):
+async def multi_regulator_search(query: str):
+    """
+    Runs the SEC, SEDAR+ and CVM searches concurrently and returns their
+    results keyed by regulator. Unlike all_regulators_search this keeps one
+    result per source, at the cost of three Serper calls.
+    """
+    results = await asyncio.gather(
+        sec_edgar_search(query),
+        sedar_plus_search(query),
+        cvm_empresas_net_search(query),
+        return_exceptions=True,
+    )
+    return dict(zip(("sec", "sedar", "cvm"), results))
+
+# Tags that never carry filing text; both parsers drop them before
+# extracting text.
+_STRIP_TAGS = frozenset({"script", "style", "nav", "footer", "header", "noscript", "svg", "iframe", "form"})
+_DROP_SELECTOR = ",".join(sorted(_STRIP_TAGS))
+_WS_RE = re.compile(r'\s+')
+
+def _extract_text(html: bytes, encoding=None):
+    """Extracts readable text from an HTML document, truncated to 8000 chars."""
+    # Fast path: selectolax's Lexbor engine parses an order of magnitude
+    # faster than BeautifulSoup, leaving the fetch network-dominated. Any
+    # import or parse failure falls through to the bs4/lxml path below.
+    try:
+        from selectolax.parser import HTMLParser
+
+        tree = HTMLParser(html)
+        for tag in tree.css(_DROP_SELECTOR):
+            tag.decompose()
+        text = tree.body.text(separator=' ', strip=True) if tree.body else ''
+        return _WS_RE.sub(' ', text)[:8000]
+    except Exception:
+        pass
+
+    # bs4/lxml are imported on first use so module import stays cheap for
+    # callers that never read a document
+    from bs4 import BeautifulSoup
+    # lxml's C parser is several times faster than the pure-Python
+    # html.parser on filing-sized documents; when the HTTP header declared a
+    # charset, from_encoding lets it skip its own sniffing pass
+    soup = BeautifulSoup(html, 'lxml', from_encoding=encoding)
+    for tag in soup(list(_STRIP_TAGS)):
+        tag.decompose()
+    # get_text runs the traversal in C with a single allocation; collapsing
+    # whitespace afterwards replaces the per-string strip/join loop
+    text = _WS_RE.sub(' ', soup.get_text(separator=' ', strip=True))
+    return text[:8000] # Return first 8000 characters to manage context size
+
+@_ttl_cached(ttl=_DOC_TTL)
+async def read_document_from_url(url: str):
     """
     Reads and extracts clean text content from a given URL.
     Handles basic error checking.
     """
-    print(f"--- READING DOCUMENT from: {url} ---")
+    logger.debug("READING DOCUMENT from: %s", url)
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status() # Raises an HTTPError for bad responses
-        
-        # Basic content type check; for now, we'll focus on HTML
-        if 'text/html' in response.headers.get('Content-Type', ''):
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # A simple way to extract text; can be improved
-            for script_or_style in soup(["script", "style", "nav", "footer", "header"]):
-                script_or_style.decompose()
-            text = ' '.join(t.strip() for t in soup.stripped_strings)
-            return text[:8000] # Return first 8000 characters to manage context size
-        else:
-            return f"Error: Content type is not text/html. It is {response.headers.get('Content-Type')}. Cannot process."
-
-    except requests.RequestException as e:
+        host = httpx.URL(url).host or ''
+        async with _HOST_SEMAPHORES[host]:
+            if host.endswith('sec.gov'):
+                await _SEC_LIMITER.acquire()
+            async with _AHTTP.stream("GET", url) as response:
+                response.raise_for_status() # Raises an HTTPError for bad responses
+
+                # Basic content type check; for now, we'll focus on HTML. With a
+                # streaming request the headers arrive before the body, so
+                # returning here transfers zero body bytes for PDFs/ZIPs/images —
+                # no separate Range/HEAD probe (and its extra round-trip) needed.
+                if 'text/html' not in response.headers.get('Content-Type', ''):
+                    return f"Error: Content type is not text/html. It is {response.headers.get('Content-Type')}. Cannot process."
+
+                # Both checks run on the headers alone, before any body bytes
+                # move. Servers occasionally send garbage Content-Length
+                # values; treat anything non-numeric as undeclared.
+                declared = response.headers.get('Content-Length', '')
+                content_length = int(declared) if declared.isdigit() else 0
+                if content_length > _MAX_DOC_BYTES:
+                    return f"Error: Document is too large ({content_length} bytes). Cannot process."
+
+                # Only the first 8000 characters of text are returned, so reading a
+                # multi-MB filing in full is wasted bandwidth and parser work. Pull
+                # the body in chunks and stop once we have enough HTML to cover it.
+                buf = bytearray()
+                async for chunk in response.aiter_bytes():
+                    buf.extend(chunk)
+                    if len(buf) > _READ_BYTE_BUDGET:
+                        break
+
+        # The parse is CPU-bound (hundreds of ms on filing-sized pages); run
+        # it in a worker thread so it never blocks the event loop shared by
+        # concurrent tool calls — and runs outside the per-host slot, which
+        # only covers the transfer. The raw bytes go straight to the parser —
+        # no separate decode pass — with the header charset as a hint.
+        return await asyncio.to_thread(_extract_text, bytes(buf), response.charset_encoding)
+
+    except (httpx.HTTPError, httpx.InvalidURL) as e:
+        # InvalidURL comes from httpx.URL() on malformed tool arguments
+        # (stray whitespace, overlong URLs) and is not an HTTPError subclass
         return f"Error: Could not retrieve URL. Reason: {e}"
 
-def real_sec_search(company_name: str):
+async def read_documents(urls):
+    """
+    Reads several URLs concurrently and maps each to its extracted text.
+    Failures come back as the exception object instead of aborting the batch.
+    """
+    results = await asyncio.gather(
+        *(read_document_from_url(url) for url in urls),
+        return_exceptions=True,
+    )
+    return dict(zip(urls, results))
+
+@_ttl_cached(normalize=True)
+async def real_sec_search(company_name: str):
     """
     Performs a real search on SEC EDGAR using their public API.
     """
-    print(f"--- EXECUTING REAL SEC SEARCH for: {company_name} ---")
+    logger.debug("EXECUTING REAL SEC SEARCH for: %s", company_name)
     
     try:
         # SEC EDGAR public API endpoint
         base_url = "https://data.sec.gov/submissions/CIK"
         
-        # Company CIK mappings
-        cik_mapping = {
-            "microsoft": "0000789019",
-            "apple": "0000320193", 
-            "amazon": "0001018724",
-            "google": "0001652044",
-            "alphabet": "0001652044",
-            "tesla": "0001318605",
-            "netflix": "0001065280",
-            "meta": "0001326801",
-            "facebook": "0001326801"
-        }
-        
-        company_lower = company_name.lower()
-        if company_lower in cik_mapping:
-            cik = cik_mapping[company_lower]
-            
+        cik = _resolve_cik(company_name)
+        if cik:
             # Get company filings
-            filings_url = f"https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany&CIK={cik}&type=10-K&dateb=&owner=exclude&count=10"
+            filings_url = _SEC_BROWSE_URL.format(cik=cik)
             
             # Get company info
             company_url = f"{base_url}{cik.zfill(10)}.json"
             
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'application/json'
-            }
-            
             # Get company information
-            company_response = requests.get(company_url, headers=headers, timeout=10)
+            company_response = await _sec_get(company_url, headers={'Accept': 'application/json'})
             if company_response.status_code == 200:
                 company_data = company_response.json()
                 company_title = company_data.get('entityName', company_name.title())
@@ -153,82 +488,97 @@ def real_sec_search(company_name: str):
         return f"Real SEC search attempted for {company_name}. Please visit https://www.sec.gov/edgar/searchedgar/companysearch for manual search."
         
     except Exception as e:
-        return f"Real SEC search failed: {e}"
+        # "Error" prefix keeps this out of the TTL cache and flags it as
+        # unusable to the synthesize step
+        return f"Error: Real SEC search failed: {e}"
+
+# Mock filing data for common queries with REAL, VERIFIED URLs, indexed once
+# at import time so fallback_search is a set intersection plus dict probe
+# instead of a per-call dict build and linear substring scan.
+_MOCK_RESPONSES = {
+    "microsoft": {
+        "contract_name": "Form 10-K",
+        "company_name": "Microsoft Corporation",
+        "description": "Annual report for fiscal year ending June 30, 2024. This comprehensive report includes financial statements, management discussion and analysis, risk factors, and business segment information.",
+        "filing_date": "2024-07-25",
+        "source_of_information": "SEC EDGAR",
+        "country": "United States",
+        "language": "English",
+        "applicable_law": "Securities Exchange Act of 1934",
+        "relevant_clause": "Item 1A. Risk Factors",
+        "document_url": "https://www.sec.gov/Archives/edgar/data/789019/000095017024087843/msft-20240630.htm"
+    },
+    "apple": {
+        "contract_name": "Form 10-K",
+        "company_name": "Apple Inc.",
+        "description": "Annual report for fiscal year ending September 30, 2024. Contains comprehensive financial information, business operations, and risk assessment.",
+        "filing_date": "2024-10-28",
+        "source_of_information": "SEC EDGAR",
+        "country": "United States",
+        "language": "English",
+        "applicable_law": "Securities Exchange Act of 1934",
+        "relevant_clause": "Item 1A. Risk Factors",
+        "document_url": "https://www.sec.gov/Archives/edgar/data/320193/000032019324000106/aapl-20240928.htm"
+    },
+    "petrobras": {
+        "contract_name": "Formulário de Referência",
+        "company_name": "Petrobras",
+        "description": "Reference form for the year 2024 containing comprehensive company information and financial data.",
+        "filing_date": "2024-03-15",
+        "source_of_information": "CVM Empresas.NET",
+        "country": "Brazil",
+        "language": "Portuguese",
+        "applicable_law": "Lei 6.404/76",
+        "relevant_clause": "Fatores de Risco",
+        "document_url": "https://www.cvm.gov.br/empresas/empresas-net/empresas-net"
+    },
+    "amazon": {
+        "contract_name": "Form 10-K",
+        "company_name": "Amazon.com Inc.",
+        "description": "Annual report for fiscal year ending December 31, 2023. Comprehensive overview of Amazon's business operations, financial performance, and strategic initiatives.",
+        "filing_date": "2024-02-01",
+        "source_of_information": "SEC EDGAR",
+        "country": "United States",
+        "language": "English",
+        "applicable_law": "Securities Exchange Act of 1934",
+        "relevant_clause": "Item 1A. Risk Factors",
+        "document_url": "https://www.sec.gov/Archives/edgar/data/1018724/000101872424000004/amzn-20231231.htm"
+    },
+    "google": {
+        "contract_name": "Form 10-K",
+        "company_name": "Alphabet Inc.",
+        "description": "Annual report for fiscal year ending December 31, 2023. Detailed analysis of Google's parent company operations, financial results, and future outlook.",
+        "filing_date": "2024-02-02",
+        "source_of_information": "SEC EDGAR",
+        "country": "United States",
+        "language": "English",
+        "applicable_law": "Securities Exchange Act of 1934",
+        "relevant_clause": "Item 1A. Risk Factors",
+        "document_url": "https://www.sec.gov/Archives/edgar/data/1652044/000165204424000004/googl-20231231.htm"
+    }
+}
+# One C-level scan with word boundaries beats per-token set juggling and also
+# matches possessives like "Microsoft's" that token stripping misses
+_MOCK_RE = re.compile(r"\b(" + "|".join(map(re.escape, _MOCK_RESPONSES)) + r")\b", re.IGNORECASE)
+# The response line never varies per query, so render it once per company at
+# import; a hit is then regex scan + dict probe with no string assembly.
+_MOCK_SUMMARIES = {
+    name: (
+        f"Found filing for {data['company_name']}: {data['contract_name']} "
+        f"filed on {data['filing_date']}. Document URL: {data['document_url']}"
+    )
+    for name, data in _MOCK_RESPONSES.items()
+}
 
 def fallback_search(query: str):
     """
     Fallback search method that provides mock data when Serper API fails.
     This allows the application to work even without a valid API key.
     """
-    print(f"--- EXECUTING FALLBACK SEARCH for: {query} ---")
-    
-    # Mock responses for common queries with REAL, VERIFIED URLs
-    mock_responses = {
-        "microsoft": {
-            "contract_name": "Form 10-K",
-            "company_name": "Microsoft Corporation",
-            "description": "Annual report for fiscal year ending June 30, 2024. This comprehensive report includes financial statements, management discussion and analysis, risk factors, and business segment information.",
-            "filing_date": "2024-07-25",
-            "source_of_information": "SEC EDGAR",
-            "country": "United States",
-            "language": "English",
-            "applicable_law": "Securities Exchange Act of 1934",
-            "relevant_clause": "Item 1A. Risk Factors",
-            "document_url": "https://www.sec.gov/Archives/edgar/data/789019/000095017024087843/msft-20240630.htm"
-        },
-        "apple": {
-            "contract_name": "Form 10-K",
-            "company_name": "Apple Inc.",
-            "description": "Annual report for fiscal year ending September 30, 2024. Contains comprehensive financial information, business operations, and risk assessment.",
-            "filing_date": "2024-10-28",
-            "source_of_information": "SEC EDGAR",
-            "country": "United States",
-            "language": "English",
-            "applicable_law": "Securities Exchange Act of 1934",
-            "relevant_clause": "Item 1A. Risk Factors",
-            "document_url": "https://www.sec.gov/Archives/edgar/data/320193/000032019324000106/aapl-20240928.htm"
-        },
-        "petrobras": {
-            "contract_name": "Formulário de Referência",
-            "company_name": "Petrobras",
-            "description": "Reference form for the year 2024 containing comprehensive company information and financial data.",
-            "filing_date": "2024-03-15",
-            "source_of_information": "CVM Empresas.NET",
-            "country": "Brazil",
-            "language": "Portuguese",
-            "applicable_law": "Lei 6.404/76",
-            "relevant_clause": "Fatores de Risco",
-            "document_url": "https://www.cvm.gov.br/empresas/empresas-net/empresas-net"
-        },
-        "amazon": {
-            "contract_name": "Form 10-K",
-            "company_name": "Amazon.com Inc.",
-            "description": "Annual report for fiscal year ending December 31, 2023. Comprehensive overview of Amazon's business operations, financial performance, and strategic initiatives.",
-            "filing_date": "2024-02-01",
-            "source_of_information": "SEC EDGAR",
-            "country": "United States",
-            "language": "English",
-            "applicable_law": "Securities Exchange Act of 1934",
-            "relevant_clause": "Item 1A. Risk Factors",
-            "document_url": "https://www.sec.gov/Archives/edgar/data/1018724/000101872424000004/amzn-20231231.htm"
-        },
-        "google": {
-            "contract_name": "Form 10-K",
-            "company_name": "Alphabet Inc.",
-            "description": "Annual report for fiscal year ending December 31, 2023. Detailed analysis of Google's parent company operations, financial results, and future outlook.",
-            "filing_date": "2024-02-02",
-            "source_of_information": "SEC EDGAR",
-            "country": "United States",
-            "language": "English",
-            "applicable_law": "Securities Exchange Act of 1934",
-            "relevant_clause": "Item 1A. Risk Factors",
-            "document_url": "https://www.sec.gov/Archives/edgar/data/1652044/000165204424000004/googl-20231231.htm"
-        }
-    }
+    logger.debug("EXECUTING FALLBACK SEARCH for: %s", query)
     
-    query_lower = query.lower()
-    for company, data in mock_responses.items():
-        if company in query_lower:
-            return f"Found filing for {data['company_name']}: {data['contract_name']} filed on {data['filing_date']}. Document URL: {data['document_url']}"
+    match = _MOCK_RE.search(query)
+    if match:
+        return _MOCK_SUMMARIES[match.group(1).casefold()]
     
     return f"Mock search completed for: {query}. No specific filing found in mock database." 
\ No newline at end of file